@@ -0,0 +1,158 @@
+"""
+Admission control for the CPU-heavy stages of the extraction service.
+
+Each stage (OCR, inference, palette, LLM) gets its own concurrency limit and a
+bounded wait queue. Requests that arrive when the queue is full are rejected
+immediately with 429, and requests that wait longer than the stage's queue
+deadline are rejected with 503. Both responses carry a Retry-After header so
+clients can back off instead of piling more work onto saturated cores.
+
+Limits are configured through environment variables, e.g.:
+
+    COLOR_SERVICE_OCR_CONCURRENCY=2
+    COLOR_SERVICE_OCR_QUEUE=8
+    COLOR_SERVICE_OCR_QUEUE_TIMEOUT=5
+"""
+
+import asyncio
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+from fastapi import HTTPException
+
+from env_config import env_float, env_int
+
+
+# Default limits per stage: (concurrency, max queued requests, queue timeout in seconds)
+DEFAULT_STAGE_LIMITS = {
+    "ocr": (max(1, (os.cpu_count() or 2) // 2), 8, 5.0),
+    "inference": (max(1, (os.cpu_count() or 2) // 2), 8, 5.0),
+    "palette": (max(1, os.cpu_count() or 2), 16, 5.0),
+    "llm": (8, 32, 15.0),
+}
+
+
+class StageLimiter:
+    """Concurrency limit with a bounded, deadline-aware wait queue for one stage."""
+
+    def __init__(self, name: str, concurrency: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = max(0.0, queue_timeout)
+
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._active = 0
+        self._waiting = 0
+
+        # Metrics
+        self._admitted = 0
+        self._shed_queue_full = 0
+        self._shed_timeout = 0
+        # Queue waits of admitted requests and of requests shed at the deadline
+        self._waits = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        # Exponentially weighted average of time spent holding a slot,
+        # used to estimate Retry-After.
+        self._avg_service_time = 1.0
+
+    def _retry_after(self) -> int:
+        """Estimate how many seconds until a slot frees up for a new request."""
+        backlog = self._waiting + 1
+        estimate = self._avg_service_time * backlog / self.concurrency
+        return max(1, math.ceil(estimate))
+
+    def _shed(self, status_code: int, reason: str) -> HTTPException:
+        return HTTPException(
+            status_code=status_code,
+            detail=f"Service busy: {self.name} stage {reason}, please retry later",
+            headers={"Retry-After": str(self._retry_after())},
+        )
+
+    def _record_wait(self, wait: float) -> None:
+        self._waits += 1
+        self._total_wait += wait
+        self._max_wait = max(self._max_wait, wait)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold one concurrency slot for this stage, waiting in the queue if needed."""
+        # Requests already holding or waiting for a slot; tracked here rather than
+        # via the semaphore so concurrent arrivals see each other immediately.
+        if self._active + self._waiting >= self.concurrency + self.max_queue:
+            self._shed_queue_full += 1
+            raise self._shed(429, "queue is full")
+
+        queued_at = time.monotonic()
+        if not self._semaphore.locked():
+            # A slot is free: take it without going through wait_for, which would
+            # cancel the acquire before it runs when queue_timeout is 0.
+            await self._semaphore.acquire()
+        elif self.queue_timeout <= 0:
+            # Queueing disabled for this stage
+            self._shed_timeout += 1
+            raise self._shed(503, "has no free slot")
+        else:
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._shed_timeout += 1
+                self._record_wait(time.monotonic() - queued_at)
+                raise self._shed(503, "queue deadline exceeded")
+            finally:
+                self._waiting -= 1
+
+        self._admitted += 1
+        self._record_wait(time.monotonic() - queued_at)
+
+        self._active += 1
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self._active -= 1
+            elapsed = time.monotonic() - started_at
+            self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * elapsed
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "max_queue": self.max_queue,
+            "queue_timeout_seconds": self.queue_timeout,
+            "active": self._active,
+            "waiting": self._waiting,
+            "admitted": self._admitted,
+            "shed_queue_full": self._shed_queue_full,
+            "shed_timeout": self._shed_timeout,
+            "avg_queue_wait_ms": round(1000 * self._total_wait / self._waits, 2) if self._waits else 0.0,
+            "max_queue_wait_ms": round(1000 * self._max_wait, 2),
+            "avg_service_time_ms": round(1000 * self._avg_service_time, 2),
+        }
+
+
+class AdmissionController:
+    """Registry of per-stage limiters, configured from environment variables."""
+
+    def __init__(self, limits: Optional[Dict[str, tuple]] = None):
+        self.stages: Dict[str, StageLimiter] = {}
+        for name, (concurrency, max_queue, queue_timeout) in (limits or DEFAULT_STAGE_LIMITS).items():
+            prefix = f"COLOR_SERVICE_{name.upper()}"
+            self.stages[name] = StageLimiter(
+                name,
+                concurrency=env_int(f"{prefix}_CONCURRENCY", concurrency),
+                max_queue=env_int(f"{prefix}_QUEUE", max_queue),
+                queue_timeout=env_float(f"{prefix}_QUEUE_TIMEOUT", queue_timeout),
+            )
+
+    def slot(self, stage: str):
+        """Async context manager admitting the caller into the given stage."""
+        return self.stages[stage].slot()
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: limiter.stats() for name, limiter in self.stages.items()}
@@ -0,0 +1,350 @@
+"""
+Vectorized color math for palette post-processing.
+
+All conversions work on whole palettes at once: RGB inputs are array-likes of
+shape (N, 3) with 0-255 channels, and every function returns one row per color.
+This keeps post-processing cheap when `color_count` is raised or when several
+palettes are processed in a batch.
+"""
+
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import webcolors
+
+
+BRAND_COLOR_CATEGORIES = ("primary", "secondary", "neutrals", "background")
+
+_HEX_RE = re.compile(r"^#?([0-9a-fA-F]{3}|[0-9a-fA-F]{6})$")
+
+# sRGB (D65) -> CIE XYZ
+_RGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+])
+_XYZ_TO_RGB = np.linalg.inv(_RGB_TO_XYZ)
+_D65_WHITE = np.array([0.95047, 1.0, 1.08883])
+
+# Linear sRGB -> OKLab (Björn Ottosson)
+_RGB_TO_LMS = np.array([
+    [0.4122214708, 0.5363325363, 0.0514459929],
+    [0.2119034982, 0.6806995451, 0.1073969566],
+    [0.0883024619, 0.2817188376, 0.6299787005],
+])
+_LMS_TO_OKLAB = np.array([
+    [0.2104542553, 0.7936177850, -0.0040720468],
+    [1.9779984951, -2.4285922050, 0.4505937099],
+    [0.0259040371, 0.7827717662, -0.8086757660],
+])
+_LMS_TO_RGB = np.linalg.inv(_RGB_TO_LMS)
+_OKLAB_TO_LMS = np.linalg.inv(_LMS_TO_OKLAB)
+
+
+# ============================================================
+# Helpers
+# ============================================================
+
+def _as_rgb(rgb: Any) -> np.ndarray:
+    """Coerce an RGB palette to a float array of shape (N, 3)."""
+    arr = np.asarray(rgb, dtype=np.float64)
+    return arr.reshape(-1, 3)
+
+
+def _to_uint8(rgb: np.ndarray) -> np.ndarray:
+    return np.clip(np.round(rgb), 0, 255).astype(np.uint8)
+
+
+def _srgb_to_linear(rgb: np.ndarray) -> np.ndarray:
+    c = rgb / 255.0
+    return np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+
+
+def _linear_to_srgb(linear: np.ndarray) -> np.ndarray:
+    linear = np.clip(linear, 0.0, 1.0)
+    c = np.where(linear <= 0.0031308, linear * 12.92, 1.055 * linear ** (1 / 2.4) - 0.055)
+    return c * 255.0
+
+
+# ============================================================
+# HEX / CMYK / HSL
+# ============================================================
+
+def parse_hex(hex_code: Any) -> Optional[str]:
+    """Normalize a HEX string to lowercase '#rrggbb', or None if it isn't valid."""
+    if not isinstance(hex_code, str):
+        return None
+    match = _HEX_RE.match(hex_code.strip())
+    if not match:
+        return None
+    digits = match.group(1).lower()
+    if len(digits) == 3:
+        digits = "".join(d * 2 for d in digits)
+    return f"#{digits}"
+
+
+def hex_to_rgb(hex_codes: Sequence[str]) -> np.ndarray:
+    """Convert HEX strings ('#rgb' or '#rrggbb') to a uint8 array of shape (N, 3)."""
+    normalized = []
+    for code in hex_codes:
+        parsed = parse_hex(code)
+        if parsed is None:
+            raise ValueError(f"Invalid HEX color: {code!r}")
+        normalized.append(parsed[1:])
+    if not normalized:
+        return np.zeros((0, 3), dtype=np.uint8)
+    return np.frombuffer(bytes.fromhex("".join(normalized)), dtype=np.uint8).reshape(-1, 3)
+
+
+def rgb_to_hex(rgb: Any) -> List[str]:
+    """Convert RGB colors to lowercase '#rrggbb' strings."""
+    packed = _to_uint8(_as_rgb(rgb)).tobytes().hex()
+    return ["#" + packed[i:i + 6] for i in range(0, len(packed), 6)]
+
+
+def rgb_to_cmyk(rgb: Any) -> np.ndarray:
+    """Convert RGB colors to CMYK percentages as an int array of shape (N, 4)."""
+    c = _as_rgb(rgb) / 255.0
+    k = 1.0 - c.max(axis=1)
+    denom = np.where(k < 1.0, 1.0 - k, 1.0)
+    cmy = np.where((k < 1.0)[:, None], (1.0 - c - k[:, None]) / denom[:, None], 0.0)
+    return np.round(np.column_stack([cmy, k]) * 100).astype(int)
+
+
+def cmyk_to_rgb(cmyk: Any) -> np.ndarray:
+    """Convert CMYK percentages to a uint8 RGB array of shape (N, 3)."""
+    arr = np.asarray(cmyk, dtype=np.float64).reshape(-1, 4) / 100.0
+    rgb = 255.0 * (1.0 - arr[:, :3]) * (1.0 - arr[:, 3:4])
+    return _to_uint8(rgb)
+
+
+def rgb_to_hsl(rgb: Any) -> np.ndarray:
+    """Convert RGB colors to HSL: hue in degrees, saturation and lightness in percent."""
+    c = _as_rgb(rgb) / 255.0
+    r, g, b = c[:, 0], c[:, 1], c[:, 2]
+    mx = c.max(axis=1)
+    mn = c.min(axis=1)
+    delta = mx - mn
+    light = (mx + mn) / 2.0
+
+    safe_delta = np.where(delta == 0, 1.0, delta)
+    sat = np.where(delta == 0, 0.0, delta / np.maximum(1.0 - np.abs(2.0 * light - 1.0), 1e-12))
+
+    hue = np.select(
+        [delta == 0, mx == r, mx == g],
+        [0.0, ((g - b) / safe_delta) % 6.0, (b - r) / safe_delta + 2.0],
+        default=(r - g) / safe_delta + 4.0,
+    ) * 60.0
+
+    return np.column_stack([hue % 360.0, sat * 100.0, light * 100.0])
+
+
+def hsl_to_rgb(hsl: Any) -> np.ndarray:
+    """Convert HSL (degrees, percent, percent) to a uint8 RGB array of shape (N, 3)."""
+    arr = np.asarray(hsl, dtype=np.float64).reshape(-1, 3)
+    h = (arr[:, 0] % 360.0)[:, None]
+    s = arr[:, 1:2] / 100.0
+    l = arr[:, 2:3] / 100.0
+    n = np.array([0.0, 8.0, 4.0])
+    k = (n + h / 30.0) % 12.0
+    a = s * np.minimum(l, 1.0 - l)
+    rgb = l - a * np.clip(np.minimum(k - 3.0, 9.0 - k), -1.0, 1.0)
+    return _to_uint8(rgb * 255.0)
+
+
+# ============================================================
+# CIE Lab / OKLCH
+# ============================================================
+
+def rgb_to_lab(rgb: Any) -> np.ndarray:
+    """Convert RGB colors to CIE L*a*b* (D65)."""
+    xyz = _srgb_to_linear(_as_rgb(rgb)) @ _RGB_TO_XYZ.T / _D65_WHITE
+    eps = (6.0 / 29.0) ** 3
+    f = np.where(xyz > eps, np.cbrt(xyz), xyz / (3 * (6.0 / 29.0) ** 2) + 4.0 / 29.0)
+    return np.column_stack([
+        116.0 * f[:, 1] - 16.0,
+        500.0 * (f[:, 0] - f[:, 1]),
+        200.0 * (f[:, 1] - f[:, 2]),
+    ])
+
+
+def lab_to_rgb(lab: Any) -> np.ndarray:
+    """Convert CIE L*a*b* (D65) to a uint8 RGB array, clipping out-of-gamut colors."""
+    arr = np.asarray(lab, dtype=np.float64).reshape(-1, 3)
+    fy = (arr[:, 0] + 16.0) / 116.0
+    f = np.column_stack([fy + arr[:, 1] / 500.0, fy, fy - arr[:, 2] / 200.0])
+    delta = 6.0 / 29.0
+    xyz = np.where(f > delta, f ** 3, 3 * delta ** 2 * (f - 4.0 / 29.0)) * _D65_WHITE
+    return _to_uint8(_linear_to_srgb(xyz @ _XYZ_TO_RGB.T))
+
+
+def rgb_to_oklch(rgb: Any) -> np.ndarray:
+    """Convert RGB colors to OKLCH: lightness 0-1, chroma, hue in degrees."""
+    lms = np.cbrt(_srgb_to_linear(_as_rgb(rgb)) @ _RGB_TO_LMS.T)
+    lab = lms @ _LMS_TO_OKLAB.T
+    chroma = np.hypot(lab[:, 1], lab[:, 2])
+    hue = np.degrees(np.arctan2(lab[:, 2], lab[:, 1])) % 360.0
+    return np.column_stack([lab[:, 0], chroma, hue])
+
+
+def oklch_to_rgb(oklch: Any) -> np.ndarray:
+    """Convert OKLCH to a uint8 RGB array, clipping out-of-gamut colors."""
+    arr = np.asarray(oklch, dtype=np.float64).reshape(-1, 3)
+    hue = np.radians(arr[:, 2])
+    lab = np.column_stack([arr[:, 0], arr[:, 1] * np.cos(hue), arr[:, 1] * np.sin(hue)])
+    lms = (lab @ _OKLAB_TO_LMS.T) ** 3
+    return _to_uint8(_linear_to_srgb(lms @ _LMS_TO_RGB.T))
+
+
+# ============================================================
+# Contrast / Delta E / Dedupe
+# ============================================================
+
+def relative_luminance(rgb: Any) -> np.ndarray:
+    """WCAG relative luminance of each color."""
+    return _srgb_to_linear(_as_rgb(rgb)) @ np.array([0.2126, 0.7152, 0.0722])
+
+
+def contrast_matrix(rgb: Any) -> np.ndarray:
+    """WCAG contrast ratios between every pair of colors, shape (N, N)."""
+    lum = relative_luminance(rgb) + 0.05
+    return np.maximum(lum[:, None], lum[None, :]) / np.minimum(lum[:, None], lum[None, :])
+
+
+def delta_e_matrix(rgb: Any) -> np.ndarray:
+    """CIE76 color difference (Euclidean distance in Lab) between every pair of colors."""
+    lab = rgb_to_lab(rgb)
+    return np.linalg.norm(lab[:, None, :] - lab[None, :, :], axis=-1)
+
+
+def dedupe_indices(rgb: Any, threshold: float) -> List[int]:
+    """
+    Indices of colors to keep after dropping near-duplicates.
+    Colors are visited in order, so earlier (more dominant) swatches win.
+    """
+    n = _as_rgb(rgb).shape[0]
+    if threshold <= 0 or n < 2:
+        return list(range(n))
+
+    distances = delta_e_matrix(rgb)
+    keep = np.zeros(n, dtype=bool)
+    for i in range(n):
+        if not np.any(distances[i, keep] < threshold):
+            keep[i] = True
+    return np.flatnonzero(keep).tolist()
+
+
+# ============================================================
+# Color Names
+# ============================================================
+
+@lru_cache(maxsize=1)
+def _css3_palette() -> Tuple[List[str], np.ndarray]:
+    """CSS3 color names and their RGB values, built once."""
+    try:
+        names = list(webcolors.names("css3"))  # new API (>=24.x)
+        hex_codes = [webcolors.name_to_hex(n, spec="css3") for n in names]
+    except Exception:
+        # fallback for old versions (<24.x)
+        from webcolors import CSS3_NAMES_TO_HEX
+        names = list(CSS3_NAMES_TO_HEX.keys())
+        hex_codes = list(CSS3_NAMES_TO_HEX.values())
+    return names, hex_to_rgb(hex_codes).astype(np.int64)
+
+
+def nearest_color_names(rgb: Any) -> List[str]:
+    """Closest CSS3 color name for each color (exact name when there is one)."""
+    colors = _to_uint8(_as_rgb(rgb)).astype(np.int64)
+    if colors.shape[0] == 0:
+        return []
+
+    names, table = _css3_palette()
+    distances = ((colors[:, None, :] - table[None, :, :]) ** 2).sum(axis=-1)
+    nearest = distances.argmin(axis=1)
+
+    result = []
+    for hex_code, idx, dist in zip(rgb_to_hex(colors), nearest, distances[np.arange(len(nearest)), nearest]):
+        if dist == 0:
+            try:
+                result.append(webcolors.hex_to_name(hex_code, spec="css3"))
+                continue
+            except ValueError:
+                pass
+        result.append(names[idx])
+    return result
+
+
+# ============================================================
+# Palette Post-Processing
+# ============================================================
+
+def describe_palette(rgb: Any) -> List[Dict[str, Any]]:
+    """Build the name/hex/rgb/cmyk entries used in API responses for a palette."""
+    colors = _to_uint8(_as_rgb(rgb))
+    return [
+        {"name": name, "hex": hex_code, "rgb": values, "cmyk": cmyk}
+        for name, hex_code, values, cmyk in zip(
+            nearest_color_names(colors),
+            rgb_to_hex(colors),
+            colors.tolist(),
+            rgb_to_cmyk(colors).tolist(),
+        )
+    ]
+
+
+def _entry_rgb(entry: Dict[str, Any]) -> Optional[Iterable[int]]:
+    """RGB for an LLM-returned color entry, preferring its HEX value."""
+    parsed = parse_hex(entry.get("hex"))
+    if parsed is not None:
+        return hex_to_rgb([parsed])[0].tolist()
+
+    rgb = entry.get("rgb")
+    if (
+        isinstance(rgb, (list, tuple))
+        and len(rgb) == 3
+        and all(isinstance(v, (int, float)) and 0 <= v <= 255 for v in rgb)
+    ):
+        return [int(round(v)) for v in rgb]
+    return None
+
+
+def normalize_brand_color_system(system: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Normalize a brand color system returned by the LLM.
+    HEX is treated as the source of truth; rgb and cmyk are recomputed from it
+    (falling back to rgb when HEX is missing or malformed), missing names are
+    filled with the nearest CSS3 name, and unusable entries are dropped.
+    """
+    slots: List[Tuple[str, Dict[str, Any]]] = []
+    rgb_rows: List[Iterable[int]] = []
+    for category in BRAND_COLOR_CATEGORIES:
+        entries = system.get(category) or []
+        if not isinstance(entries, list):
+            continue
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            rgb = _entry_rgb(entry)
+            if rgb is None:
+                continue
+            slots.append((category, entry))
+            rgb_rows.append(rgb)
+
+    normalized: Dict[str, List[Dict[str, Any]]] = {category: [] for category in BRAND_COLOR_CATEGORIES}
+    if not slots:
+        return normalized
+
+    colors = np.array(rgb_rows, dtype=np.uint8)
+    described = describe_palette(colors)
+    for (category, entry), computed in zip(slots, described):
+        name = entry.get("name")
+        normalized[category].append({
+            **entry,
+            "name": name if isinstance(name, str) and name.strip() else computed["name"],
+            "hex": computed["hex"],
+            "rgb": computed["rgb"],
+            "cmyk": computed["cmyk"],
+        })
+    return normalized
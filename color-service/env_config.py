@@ -0,0 +1,29 @@
+"""
+Tolerant environment variable parsing shared by the service's config readers.
+Malformed values fall back to the default instead of failing at import time.
+"""
+
+import os
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        print(f"⚠️ Invalid integer for {name}, using default {default}")
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        print(f"⚠️ Invalid number for {name}, using default {default}")
+        return default
+
+
+def env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name, "").strip().lower()
+    if not value:
+        return default
+    return value not in ("0", "false", "no", "off")
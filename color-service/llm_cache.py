@@ -0,0 +1,241 @@
+"""
+Persistent cache for Gemini responses.
+
+Entries are keyed by the exact prompt text and model name, plus a perceptual
+fingerprint of the logo. A lookup matches any stored fingerprint within
+`max_distance` bits, which tolerates the small changes re-encoding causes.
+The default distance comes from tools/measure_fingerprint.py. The cache lives
+in a local SQLite file with a TTL and least-recently-used eviction once it
+grows past its size budget.
+
+Configuration (environment variables):
+
+    COLOR_SERVICE_LLM_CACHE_ENABLED=1
+    COLOR_SERVICE_LLM_CACHE_DIR=.cache/llm
+    COLOR_SERVICE_LLM_CACHE_MAX_BYTES=67108864
+    COLOR_SERVICE_LLM_CACHE_TTL=604800
+    COLOR_SERVICE_LLM_CACHE_MAX_DISTANCE=4
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from PIL import Image
+
+from env_config import env_bool, env_float, env_int
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    """RGB copy of an image with transparent areas composited onto white."""
+    if image.mode in ("RGBA", "LA", "P"):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGBA", rgba.size, (255, 255, 255, 255))
+        return Image.alpha_composite(background, rgba).convert("RGB")
+    return image.convert("RGB")
+
+
+def image_fingerprint(image: Image.Image, hash_size: int = 16, thumb_size: int = 8, levels: int = 8, margin: int = 2) -> str:
+    """
+    Perceptual fingerprint of an image as a hex string, compared by Hamming distance.
+
+    Combines a `hash_size` x `hash_size` difference hash (dHash) of the grayscale
+    image, which captures shapes and lettering, with a `thumb_size` x `thumb_size`
+    RGB thumbnail quantized to `levels` per channel, which captures color (a
+    grayscale hash alone can't tell a red logo from a blue one). Levels are
+    thermometer-coded so one quantization step costs one bit of distance, and a
+    dHash bit is only set for brightness steps above `margin` so codec noise in
+    flat areas doesn't flip it. Transparent areas are flattened onto white so
+    logos with alpha match their flattened re-exports.
+    """
+    rgb = _flatten(image)
+
+    gray = rgb.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS).tobytes()
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (gray[offset + col] - gray[offset + col + 1] > margin)
+
+    for value in rgb.resize((thumb_size, thumb_size), Image.BOX).tobytes():
+        level = value * levels // 256
+        bits = (bits << (levels - 1)) | ((1 << level) - 1)
+
+    total_bits = hash_size * hash_size + thumb_size * thumb_size * 3 * (levels - 1)
+    return f"{bits:0{(total_bits + 3) // 4}x}"
+
+
+def hamming_distance(a: str, b: str) -> int:
+    """Number of differing bits between two hex fingerprints."""
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def cache_key(prompt_text: str, model_name: str) -> str:
+    digest = hashlib.sha256()
+    for part in (model_name, prompt_text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class LLMResponseCache:
+    """Disk-backed LLM response cache with TTL and size-based LRU eviction."""
+
+    def __init__(self, cache_dir: str, max_bytes: int, ttl_seconds: float, max_distance: int = 4, enabled: bool = True):
+        self.enabled = enabled
+        self.max_bytes = max(0, max_bytes)
+        self.ttl_seconds = max(0.0, ttl_seconds)
+        self.max_distance = max(0, max_distance)
+
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._conn: Optional[sqlite3.Connection] = None
+
+        if not self.enabled:
+            return
+
+        try:
+            Path(cache_dir).mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(
+                os.path.join(cache_dir, "responses.sqlite3"),
+                check_same_thread=False,
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (key, fingerprint)
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+            self._conn.commit()
+        except Exception as e:
+            print(f"⚠️ LLM cache disabled, could not open {cache_dir}: {e}")
+            self.enabled = False
+            self._conn = None
+
+    @classmethod
+    def from_env(cls) -> "LLMResponseCache":
+        return cls(
+            cache_dir=os.getenv("COLOR_SERVICE_LLM_CACHE_DIR", ".cache/llm"),
+            max_bytes=env_int("COLOR_SERVICE_LLM_CACHE_MAX_BYTES", 64 * 1024 * 1024),
+            ttl_seconds=env_float("COLOR_SERVICE_LLM_CACHE_TTL", 7 * 24 * 3600),
+            max_distance=env_int("COLOR_SERVICE_LLM_CACHE_MAX_DISTANCE", 4),
+            enabled=env_bool("COLOR_SERVICE_LLM_CACHE_ENABLED", True),
+        )
+
+    def get(self, key: str, fingerprint: str) -> Optional[str]:
+        """
+        Return the cached response for `key` whose image fingerprint is closest
+        to `fingerprint` (within `max_distance` bits), or None on a miss.
+        """
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            try:
+                rows = self._conn.execute(
+                    "SELECT fingerprint, response FROM responses WHERE key = ? AND created_at >= ?",
+                    (key, now - self.ttl_seconds),
+                ).fetchall()
+                best = None
+                for stored_fingerprint, response in rows:
+                    distance = hamming_distance(stored_fingerprint, fingerprint)
+                    if distance <= self.max_distance and (best is None or distance < best[0]):
+                        best = (distance, stored_fingerprint, response)
+                if best is None:
+                    self._misses += 1
+                    return None
+
+                self._conn.execute(
+                    "UPDATE responses SET accessed_at = ? WHERE key = ? AND fingerprint = ?",
+                    (now, key, best[1]),
+                )
+                self._conn.commit()
+                self._hits += 1
+                return best[2]
+            except sqlite3.Error as e:
+                print(f"⚠️ LLM cache read failed: {e}")
+                self._misses += 1
+                return None
+
+    def set(self, key: str, fingerprint: str, model_name: str, response: str) -> None:
+        """Store a response, then evict expired and least recently used entries over budget."""
+        if not self.enabled:
+            return
+
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses "
+                    "(key, fingerprint, model, response, size, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, fingerprint, model_name, response, size, now, now),
+                )
+                self._evict(now)
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️ LLM cache write failed: {e}")
+
+    def _evict(self, now: float) -> None:
+        expired = self._conn.execute(
+            "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        self._evictions += max(0, expired)
+
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        for key, fingerprint, size in self._conn.execute(
+            "SELECT key, fingerprint, size FROM responses ORDER BY accessed_at ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ? AND fingerprint = ?", (key, fingerprint))
+            total -= size
+            self._evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._hits + self._misses
+        entries, total_bytes = 0, 0
+        if self.enabled:
+            with self._lock:
+                try:
+                    entries, total_bytes = self._conn.execute(
+                        "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+                    ).fetchone()
+                except sqlite3.Error:
+                    pass
+        return {
+            "enabled": self.enabled,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            "evictions": self._evictions,
+            "entries": entries,
+            "bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "max_distance": self.max_distance,
+        }
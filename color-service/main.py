@@ -2,20 +2,26 @@ import os
 import json
 import re
 import base64
+import threading
+from contextlib import contextmanager
 from io import BytesIO
 from typing import Union, List, Dict, Any, Optional
 from pathlib import Path
 
 import uvicorn
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
 from colorthief import ColorThief
-import webcolors
 import google.generativeai as genai
 
+import color_math
+from admission import AdmissionController
+from llm_cache import LLMResponseCache, cache_key, image_fingerprint
+
 # Font detection imports
 try:
     import yaml
@@ -66,83 +72,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ============================================================
-# Utility Functions (from your original code)
-# ============================================================
-
-def _to_hex(rgb: tuple) -> str:
-    """Convert RGB tuple to HEX string."""
-    return "#{:02x}{:02x}{:02x}".format(*rgb)
-
+# Per-stage concurrency limits so bursts of uploads don't all compete for the same cores
+admission = AdmissionController()
 
-def _to_cmyk(rgb: tuple) -> tuple:
-    """Convert RGB -> CMYK (percent values)."""
-    r, g, b = [x / 255.0 for x in rgb]
-    k = 1 - max(r, g, b)
-    if k == 1:
-        return (0, 0, 0, 100)
-    c = (1 - r - k) / (1 - k)
-    m = (1 - g - k) / (1 - k)
-    y = (1 - b - k) / (1 - k)
-    return (round(c * 100), round(m * 100), round(y * 100), round(k * 100))
-
-
-def _get_color_name(hex_code: str) -> str:
-    """Return closest CSS3 color name to the given HEX code."""
-    try:
-        # Exact name if available
-        return webcolors.hex_to_name(hex_code, spec="css3")
-    except ValueError:
-        pass
-
-    # Fallback: find closest by Euclidean distance
-    try:
-        all_names = webcolors.names("css3")  # new API (>=24.x)
-        all_hex = [webcolors.name_to_hex(n, spec="css3") for n in all_names]
-    except Exception:
-        # fallback for old versions (<24.x)
-        from webcolors import CSS3_NAMES_TO_HEX
-        all_names = list(CSS3_NAMES_TO_HEX.keys())
-        all_hex = list(CSS3_NAMES_TO_HEX.values())
-
-    target_rgb = webcolors.hex_to_rgb(hex_code)
-    min_distance = float("inf")
-    closest_name = None
-
-    for name, code in zip(all_names, all_hex):
-        r_c, g_c, b_c = webcolors.hex_to_rgb(code)
-        distance = (r_c - target_rgb.red) ** 2 + (g_c - target_rgb.green) ** 2 + (b_c - target_rgb.blue) ** 2
-        if distance < min_distance:
-            min_distance = distance
-            closest_name = name
-
-    return closest_name or "Unnamed Color"
+# Disk-backed cache of Gemini responses, shared by all generation endpoints
+llm_cache = LLMResponseCache.from_env()
 
+GEMINI_MODEL = 'gemini-2.5-flash'
 
 # ============================================================
 # Color Extraction Functions
 # ============================================================
 
-def extract_colors_from_bytes(image_bytes: bytes, color_count: int = 7) -> Dict[str, Any]:
+def extract_colors_from_bytes(image_bytes: bytes, color_count: int = 7, dedupe_delta_e: float = 0.0) -> Dict[str, Any]:
     """
     Extract dominant colors from image bytes.
     Returns HEX, RGB, CMYK, Name.
+    Swatches closer than `dedupe_delta_e` (CIE76) to a more dominant one are dropped.
     """
     try:
         fp = BytesIO(image_bytes)
         ct = ColorThief(fp)
         palette: List[tuple] = ct.get_palette(color_count=color_count)
 
-        colors = []
-        for rgb in palette:
-            hex_code = _to_hex(rgb)
-            colors.append({
-                "name": _get_color_name(hex_code),
-                "hex": hex_code,
-                "rgb": list(rgb),
-                "cmyk": list(_to_cmyk(rgb))
-            })
-        return {"colors": colors}
+        if dedupe_delta_e > 0:
+            palette = [palette[i] for i in color_math.dedupe_indices(palette, dedupe_delta_e)]
+
+        return {"colors": color_math.describe_palette(palette)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Color extraction failed: {str(e)}")
 
@@ -306,25 +262,96 @@ Use only well-known, professional fonts like: Inter, Roboto, Montserrat, Poppins
 # AI Generation Functions
 # ============================================================
 
-def generate_brand_colors(image_bytes: bytes, palette: Dict[str, Any], api_key: str) -> Dict[str, Any]:
+def _lookup_cached_response(prompt_text: str, image_bytes: bytes) -> tuple:
+    """
+    Look up a cached Gemini response for this prompt and logo.
+    Returns (cached_text, cache_entry); cache_entry is the (key, fingerprint)
+    pair a fresh response should be stored under.
+    """
+    from PIL import Image
+    import io
+    key = cache_key(prompt_text, GEMINI_MODEL)
+    fingerprint = image_fingerprint(Image.open(io.BytesIO(image_bytes)))
+    return llm_cache.get(key, fingerprint), (key, fingerprint)
+
+
+class _GeminiKeyGuard:
+    """
+    Serialize API key changes on the global genai configuration.
+
+    genai.configure() is process-wide and the model picks up its client during
+    generate_content, so with calls running concurrently in the threadpool a
+    request with a different api_key could switch the key under another
+    request's call. Calls using the configured key run concurrently; a call
+    with a different key waits until in-flight calls finish, then reconfigures.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._api_key: Optional[str] = None
+        self._in_flight = 0
+
+    @contextmanager
+    def using(self, api_key: str):
+        with self._cond:
+            while self._api_key != api_key and self._in_flight > 0:
+                self._cond.wait()
+            if self._api_key != api_key:
+                genai.configure(api_key=api_key)
+                self._api_key = api_key
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+
+gemini_key_guard = _GeminiKeyGuard()
+
+
+def _call_gemini(prompt_text: str, image_bytes: bytes, api_key: str) -> str:
+    """Run Gemini on a prompt + logo image and return the raw response text."""
+    # Convert image bytes to PIL Image
+    from PIL import Image
+    import io
+    image = Image.open(io.BytesIO(image_bytes))
+
+    with gemini_key_guard.using(api_key):
+        model = genai.GenerativeModel(GEMINI_MODEL)
+        return model.generate_content([prompt_text, image]).text.strip()
+
+
+async def _generate_raw_text(prompt_text: str, image_bytes: bytes, api_key: str, use_cache: bool) -> tuple:
+    """
+    Get Gemini's response text, serving repeated requests from the LLM cache.
+    The cache is checked before taking an llm admission slot, so hits are served
+    even while Gemini is saturated. Returns (raw_text, cache_entry); cache_entry
+    is set only on a miss, and callers store the response once it has parsed.
+    """
+    cache_entry = None
+    if use_cache and llm_cache.enabled:
+        cached, cache_entry = await run_in_threadpool(_lookup_cached_response, prompt_text, image_bytes)
+        if cached is not None:
+            print("LLM cache hit")
+            return cached, None
+
+    async with admission.slot("llm"):
+        raw = await run_in_threadpool(_call_gemini, prompt_text, image_bytes, api_key)
+    return raw, cache_entry
+
+
+async def generate_brand_colors(image_bytes: bytes, palette: Dict[str, Any], api_key: str, use_cache: bool = True) -> Dict[str, Any]:
     """Generate professional brand color system using Gemini AI."""
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.5-flash')
-
-        # Convert image bytes to PIL Image
-        from PIL import Image
-        import io
-        image = Image.open(io.BytesIO(image_bytes))
-        
         # Prepare the prompt and image
         prompt_text = f"{brand_color_prompt}\n\nHere is the extracted ColorThief palette:\n{json.dumps(palette, indent=2)}"
         
-        # Generate content with image
-        response = model.generate_content([prompt_text, image])
+        # Generate content with image (or reuse a cached response)
+        raw, pending_cache_entry = await _generate_raw_text(prompt_text, image_bytes, api_key, use_cache)
         
         # Parse JSON
-        raw = response.text.strip()
         fenced_match = re.search(r"```(?:json)?\s*([\s\S]*?)\s*```", raw, re.IGNORECASE)
         cleaned = fenced_match.group(1).strip() if fenced_match else raw
 
@@ -342,27 +369,24 @@ def generate_brand_colors(image_bytes: bytes, palette: Dict[str, Any], api_key:
             else:
                 return {"error": "No JSON object found", "raw": raw}
 
-        return {
-            "primary": parsed.get("primary", []),
-            "secondary": parsed.get("secondary", []),
-            "neutrals": parsed.get("neutrals", []),
-            "background": parsed.get("background", [])
-        }
+        if not isinstance(parsed, dict):
+            return {"error": "Brand color JSON is not an object", "raw": raw}
+
+        if pending_cache_entry:
+            await run_in_threadpool(llm_cache.set, *pending_cache_entry, GEMINI_MODEL, raw)
+
+        # Recompute rgb/cmyk from hex so the LLM's arithmetic never reaches the client
+        return color_math.normalize_brand_color_system(parsed)
+    except HTTPException:
+        # Load shedding from the llm admission slot
+        raise
     except Exception as e:
         return {"error": f"AI generation failed: {str(e)}"}
 
 
-def generate_typography_from_logo(image_bytes: bytes, brand_info: Dict[str, str], api_key: str, detected_font: Optional[str] = None) -> Dict[str, Any]:
+async def generate_typography_from_logo(image_bytes: bytes, brand_info: Dict[str, str], api_key: str, detected_font: Optional[str] = None, use_cache: bool = True) -> Dict[str, Any]:
     """Generate typography recommendations from logo using Gemini AI."""
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.5-flash')
-
-        # Convert image bytes to PIL Image
-        from PIL import Image
-        import io
-        image = Image.open(io.BytesIO(image_bytes))
-        
         brand_context = f"""
 Brand: {brand_info.get('brand_name', 'Your Brand')}
 Domain: {brand_info.get('brand_domain', 'General Business')}
@@ -381,11 +405,10 @@ Target Audience: {brand_info.get('audience', 'General audience')}
         # Prepare the prompt and image  
         prompt_text = f"{brand_context}\n\n{typography_prompt}"
         
-        # Generate content with image
-        response = model.generate_content([prompt_text, image])
+        # Generate content with image (or reuse a cached response)
+        raw, pending_cache_entry = await _generate_raw_text(prompt_text, image_bytes, api_key, use_cache)
         
         # Parse JSON
-        raw = response.text.strip()
         fenced_match = re.search(r"```(?:json)?\s*([\s\S]*?)\s*```", raw, re.IGNORECASE)
         cleaned = fenced_match.group(1).strip() if fenced_match else raw
 
@@ -403,7 +426,13 @@ Target Audience: {brand_info.get('audience', 'General audience')}
             else:
                 return {"error": "No typography JSON object found", "raw": raw}
 
+        if pending_cache_entry:
+            await run_in_threadpool(llm_cache.set, *pending_cache_entry, GEMINI_MODEL, raw)
+
         return parsed
+    except HTTPException:
+        # Load shedding from the llm admission slot
+        raise
     except Exception as e:
         return {"error": f"Typography generation failed: {str(e)}"}
 
@@ -416,7 +445,10 @@ Target Audience: {brand_info.get('audience', 'General audience')}
 async def extract_colors_endpoint(
     file: UploadFile = File(...),
     color_count: int = Form(5),
-    api_key: str = Form(...)
+    api_key: str = Form(...),
+    dedupe_delta_e: float = Form(0.0),
+    include_contrast: bool = Form(False),
+    use_cache: bool = Form(True)
 ):
     """Extract colors from uploaded logo and generate brand color system."""
     try:
@@ -428,19 +460,27 @@ async def extract_colors_endpoint(
         image_bytes = await file.read()
         
         # Extract colors using ColorThief
-        palette = extract_colors_from_bytes(image_bytes, color_count)
+        async with admission.slot("palette"):
+            palette = await run_in_threadpool(extract_colors_from_bytes, image_bytes, color_count, dedupe_delta_e)
         
         # Generate brand color system using AI
-        brand_colors = generate_brand_colors(image_bytes, palette, api_key)
+        # Takes an llm admission slot only on a cache miss
+        brand_colors = await generate_brand_colors(image_bytes, palette, api_key, use_cache)
         
         if "error" in brand_colors:
             raise HTTPException(status_code=500, detail=brand_colors["error"])
         
-        return JSONResponse(content={
+        content = {
             "success": True,
             "extracted_palette": palette,
             "brand_color_system": brand_colors
-        })
+        }
+        if include_contrast:
+            # WCAG contrast ratios between every pair of extracted swatches
+            rgb = [color["rgb"] for color in palette["colors"]]
+            content["contrast_matrix"] = color_math.contrast_matrix(rgb).round(2).tolist()
+        
+        return JSONResponse(content=content)
         
     except HTTPException:
         raise
@@ -457,7 +497,8 @@ async def extract_typography_endpoint(
     mood: str = Form("Professional"),
     audience: str = Form("General audience"),
     api_key: str = Form(...),
-    detected_font: Optional[str] = Form(default=None)
+    detected_font: Optional[str] = Form(default=None),
+    use_cache: bool = Form(True)
 ):
     """Extract typography recommendations from uploaded logo."""
     try:
@@ -490,7 +531,8 @@ async def extract_typography_endpoint(
         print(f"Will use {'DETECTED FONT' if detected_font else 'AI-SUGGESTED FONTS'} mode")
         
         # Generate typography using AI with detected font (if provided)
-        typography = generate_typography_from_logo(image_bytes, brand_info, api_key, detected_font)
+        # Takes an llm admission slot only on a cache miss
+        typography = await generate_typography_from_logo(image_bytes, brand_info, api_key, detected_font, use_cache)
         
         print(f"Typography generation result - primary font: {typography.get('primary_font', {}).get('name', 'Unknown')}")
         
@@ -563,12 +605,23 @@ class FontDetector:
             print("Font detector not available, returning None")
             return None
         
-        # Load image
+        img = self.load_image(image_path_or_bytes)
+        boxes = self.find_text_boxes(img)
+        if not boxes:
+            return None
+        return self.classify_text_boxes(img, boxes, topk)
+    
+    def load_image(self, image_path_or_bytes: Union[str, bytes]):
+        """Load an image from a path or raw bytes as RGB."""
         if isinstance(image_path_or_bytes, bytes):
-            img = PILImage.open(BytesIO(image_path_or_bytes)).convert("RGB")
-        else:
-            img = PILImage.open(image_path_or_bytes).convert("RGB")
-        
+            return PILImage.open(BytesIO(image_path_or_bytes)).convert("RGB")
+        return PILImage.open(image_path_or_bytes).convert("RGB")
+    
+    def find_text_boxes(self, img) -> List[tuple]:
+        """
+        OCR stage: find text regions in the image.
+        Returns a list of (left, top, width, height, text) tuples, empty if no text is found.
+        """
         # OCR: detect if any text exists
         # Try multiple OCR configurations for better detection
         boxes = []
@@ -609,16 +662,21 @@ class FontDetector:
                         
         except Exception as e:
             print(f"OCR failed: {e}")
-            return None
+            return []
         
         print(f"OCR detected {len(boxes)} text regions")
         if boxes:
             print(f"Text found: {[b[4] for b in boxes]}")
-        
-        if not boxes:
+        else:
             print("No text detected in logo after trying multiple OCR configurations")
-            return None  # No text detected
         
+        return boxes
+    
+    def classify_text_boxes(self, img, boxes: List[tuple], topk: int = 1) -> Optional[str]:
+        """
+        Inference stage: run the ONNX model on each text region.
+        Returns the best font prediction overall.
+        """
         predictions = []
         for (x, y, w, h, text) in boxes:
             crop = img.crop((x, y, x + w, y + h))
@@ -661,7 +719,14 @@ async def detect_font_endpoint(
         # Try font detection if available
         detected_font = None
         if font_detector and font_detector.available:
-            detected_font = font_detector.detect_font(image_data)
+            # Decoding is CPU work too, so it shares the OCR slot
+            async with admission.slot("ocr"):
+                img = await run_in_threadpool(font_detector.load_image, image_data)
+                boxes = await run_in_threadpool(font_detector.find_text_boxes, img)
+            
+            if boxes:
+                async with admission.slot("inference"):
+                    detected_font = await run_in_threadpool(font_detector.classify_text_boxes, img, boxes)
         
         return JSONResponse(content={
             "success": True,
@@ -670,6 +735,8 @@ async def detect_font_endpoint(
             "message": "Font detected from logo" if detected_font else "No text detected in logo"
         })
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Font detection failed: {str(e)}")
 
@@ -684,6 +751,15 @@ async def health_check():
     }
 
 
+@app.get("/metrics")
+async def metrics():
+    """Service metrics: admission control per stage and LLM response cache hit rate."""
+    return {
+        "admission": admission.stats(),
+        "llm_cache": llm_cache.stats()
+    }
+
+
 # ============================================================
 # Run Server
 # ============================================================
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Measure LLM cache fingerprint distances on synthetic logos.
+
+Prints the largest distance between a logo and its re-encoded copies (PNG,
+JPEG, WebP, resized, transparent background) and the smallest distance between
+distinct logo variants (different wordmark, color or layout). The cache's
+COLOR_SERVICE_LLM_CACHE_MAX_DISTANCE default must sit between the two.
+
+Usage (from color-service/):
+    python tools/measure_fingerprint.py
+"""
+
+import io
+import itertools
+import os
+import sys
+
+from PIL import Image, ImageDraw, ImageFont
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_cache import hamming_distance, image_fingerprint  # noqa: E402
+
+
+WORDS = ["ACME", "Globex", "Initech", "Umbrella", "Acme"]
+COLORS = [(20, 60, 200), (200, 20, 20), (20, 150, 60), (30, 30, 30), (240, 140, 20)]
+
+
+def _font(size: int):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 has no sized default font
+        return ImageFont.load_default()
+
+
+def make_logo(word: str, color: tuple, mark: str = "circle", text_only: bool = False,
+              transparent: bool = False, offset: int = 0) -> Image.Image:
+    background = (0, 0, 0, 0) if transparent else (255, 255, 255, 255)
+    img = Image.new("RGBA", (480, 200), background)
+    draw = ImageDraw.Draw(img)
+    x = 30 + offset
+    if not text_only:
+        box = (x, 40, x + 120, 160)
+        if mark == "circle":
+            draw.ellipse(box, fill=color + (255,))
+        else:
+            draw.rectangle(box, fill=color + (255,))
+        x += 150
+    draw.text((x, 70), word, fill=color + (255,), font=_font(56))
+    return img
+
+
+def reencodings(img: Image.Image) -> dict:
+    img = img.convert("RGBA")
+    flat = Image.alpha_composite(Image.new("RGBA", img.size, "white"), img).convert("RGB")
+    out = {}
+
+    def save(name, image, fmt, **kwargs):
+        buf = io.BytesIO()
+        image.save(buf, fmt, **kwargs)
+        out[name] = Image.open(io.BytesIO(buf.getvalue()))
+
+    save("png", img, "PNG")
+    for quality in (30, 60, 90):
+        save(f"jpeg-q{quality}", flat, "JPEG", quality=quality)
+    save("webp-q50", flat, "WEBP", quality=50)
+    save("half-size", flat.resize((img.width // 2, img.height // 2), Image.LANCZOS), "PNG")
+    save("double-size", flat.resize((img.width * 2, img.height * 2), Image.LANCZOS), "JPEG", quality=85)
+    return out
+
+
+def variants() -> dict:
+    logos = {}
+    for word, color in itertools.product(WORDS, COLORS):
+        logos[f"circle/{word}/{color}"] = make_logo(word, color)
+    for word in WORDS:
+        logos[f"square/{word}"] = make_logo(word, COLORS[0], mark="square")
+        logos[f"text-only/{word}"] = make_logo(word, COLORS[3], text_only=True)
+        logos[f"shifted/{word}"] = make_logo(word, COLORS[0], offset=40)
+    for color in COLORS + [(255, 255, 255), (0, 0, 0)]:
+        logos[f"flat/{color}"] = Image.new("RGB", (300, 300), color)
+    return logos
+
+
+def main() -> None:
+    logos = variants()
+    fingerprints = {name: image_fingerprint(img) for name, img in logos.items()}
+
+    worst_same = (0, None)
+    worst_by_kind = {}
+    for name, img in logos.items():
+        for kind, copy in reencodings(img).items():
+            distance = hamming_distance(fingerprints[name], image_fingerprint(copy))
+            worst_by_kind[kind] = max(worst_by_kind.get(kind, 0), distance)
+            if distance > worst_same[0]:
+                worst_same = (distance, f"{name} vs {kind}")
+    # Transparent background vs the same logo on white
+    for word in WORDS:
+        distance = hamming_distance(
+            image_fingerprint(make_logo(word, COLORS[0], transparent=True)),
+            fingerprints[f"circle/{word}/{COLORS[0]}"],
+        )
+        worst_by_kind["transparent"] = max(worst_by_kind.get("transparent", 0), distance)
+        if distance > worst_same[0]:
+            worst_same = (distance, f"circle/{word} transparent vs white")
+
+    closest = sorted(
+        (hamming_distance(fingerprints[a], fingerprints[b]), a, b)
+        for a, b in itertools.combinations(logos, 2)
+    )
+
+    print(f"Fingerprint bits: {len(next(iter(fingerprints.values()))) * 4}")
+    print(f"Logos: {len(logos)}, distinct fingerprints: {len(set(fingerprints.values()))}")
+    print(f"Max distance, same logo re-encoded: {worst_same[0]} ({worst_same[1]})")
+    for kind, distance in sorted(worst_by_kind.items()):
+        print(f"  {distance:4d}  {kind}")
+    print("Min distances, different logos:")
+    for distance, a, b in closest[:5]:
+        print(f"  {distance:4d}  {a} vs {b}")
+
+
+if __name__ == "__main__":
+    main()